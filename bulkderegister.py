@@ -1,10 +1,11 @@
 # Name: bulkderegister.py
 # Purpose: Script to bulk remove inactive devices through Carbon Black Cloud Devices API
-# Version: 0.1.0
-# Last Update: 2020-01-05
+# Version: 0.2.0
+# Last Update: 2026-10-19
 #
 # Update history:
 # 0,1.0 - initial release
+# 0.2.0 - added post removal verification, bisected retry and per device result
 #
 # Copyright (c) 2020 Steve Chan
 #
@@ -29,8 +30,9 @@
 #		content format: <device>,<hostname>,<inactive_date_cutoff_date>,<last_contact_date>,<sensor_version>
 #
 # Output file:
-#	bulkderegister-result.csv - Contain result of the bulk removal operation
-#		content format: <delete_result>,<[hostname1-hostname2-.....]
+#	bulkderegister-result.csv - Contain result of the bulk removal operation, in the same order as the input file
+#		content format: <device>,<result>,<attempts>
+#			result: success | uninstall_failed | delete_failed | unknown_error | still_registered | unverified | not_found | invalid_id | status_<device_status>
 #
 # Reference: https://developer.carbonblack.com/reference/carbon-black-cloud/platform/latest/devices-api/
 # Reference section: Device Actions
@@ -40,6 +42,13 @@
 # but this does not mean the deletion of the the whole batch failed
 # CB might might throttle API call and might caused deregistration failure
 # Use with caution as there is no check of whether a device is back online before deregistration
+# After each batch the device status is queried in bulk through the Search Devices API
+# A device is reported success only when its status is DELETED
+# A device missing from the status query result (e.g. mistyped or purged id) is reported not_found
+# Only the devices still registered are retried, in bisected batches, up to retry_max attempts
+# A device is reported with the result of its last removal attempt if it is still registered after retry_max attempts
+# A device is reported unverified when the status query failed and is not retried
+# A device neither REGISTERED nor DELETED (e.g. uninstall pending) is reported as status_<device_status> and is not retried
 
 import sys
 import csv
@@ -47,11 +56,16 @@ import requests
 import json
 import time
 
-count = 0
 batch = 0
 batch_max = 50
+verify_max = 100
+verify_delay = 10
+retry_max = 4
 devices_list = []
-dev_list = ''
+pending_list = []
+outcomes = {}
+
+result_name = {204: 'still_registered', 401: 'uninstall_failed', 402: 'delete_failed'}
 
 # Need to uninstall before delete
 # Note: 2019-12-31 there is a discrepancy on the API document. DEREGISTER_SENSOR is an invalid action and should be UNINSTALL_SENSOR
@@ -69,6 +83,74 @@ def remove_device(device_list):
 		response.status_code = 401
 	return (response.status_code)
 
+# Query the devices status in chunks of verify_max devices, DELETED devices included
+# Return the status of the devices found, keyed by the device id as read from the input file,
+# and the devices which status could not be retrieved
+def verify_removed(device_list):
+	url_search = "https://defense-prod05.conferdeploy.net/appservices/v6/orgs/" + org_key + "/devices/_search"
+	device_status = {}
+	unverified = set()
+	for start in range(0, len(device_list), verify_max):
+		chunk = device_list[start:start + verify_max]
+		data = {"criteria": {"id": [int(device_id) for device_id in chunk], "status": ["ALL"]}, "start": 0, "rows": len(chunk)}
+		response = requests.post(url_search,headers=auth_header,json=data)
+		if response.status_code != 200:
+			print ('Status query failed with return code', response.status_code)
+			unverified.update(chunk)
+			continue
+		try:
+			results = response.json()['results']
+		except (ValueError, KeyError):
+			print ('Status query returned no results list')
+			unverified.update(chunk)
+			continue
+		# match on the numeric id so an input id with leading zeros is found
+		found = {}
+		for device in results:
+			found[int(device.get('id'))] = str(device.get('status'))
+		for device_id in chunk:
+			if int(device_id) in found:
+				device_status[device_id] = found[int(device_id)]
+	return (device_status, unverified)
+
+def process_batch(device_list, attempt):
+	d = remove_device(device_list)
+	time.sleep(verify_delay)
+	device_status, unverified = verify_removed(device_list)
+	retry_list = []
+	for device_id in device_list:
+		if device_id in unverified:
+			outcomes[device_id] = ('unverified', attempt)
+		elif device_id not in device_status:
+			outcomes[device_id] = ('not_found', attempt)
+		elif device_status[device_id] == 'DELETED':
+			outcomes[device_id] = ('success', attempt)
+		elif device_status[device_id] == 'REGISTERED':
+			retry_list.append(device_id)
+		else:
+			outcomes[device_id] = ('status_' + device_status[device_id].lower(), attempt)
+	if len(retry_list) == 0:
+		return
+	if attempt >= retry_max:
+		for device_id in retry_list:
+			outcomes[device_id] = (result_name.get(d, 'unknown_error'), attempt)
+		return
+	print (len(retry_list), 'of', len(device_list), 'endpoints still registered. Retrying attempt', attempt + 1)
+	half = (len(retry_list) + 1) // 2
+	for retry_batch in (retry_list[:half], retry_list[half:]):
+		if len(retry_batch) > 0:
+			process_batch(retry_batch, attempt + 1)
+
+def write_batch(device_list):
+	removed = 0
+	for device_id in device_list:
+		result, attempts = outcomes[device_id]
+		if result == 'success':
+			removed += 1
+		inactive_result.write(device_id + ',' + result + ',' + str(attempts) + '\n')
+	outcomes.clear()
+	print ('Batch', batch, 'removed', removed, 'of', len(device_list), 'endpoints')
+
 # read keys info
 with open('apikey.txt') as apikeyfile:
 	apikey = csv.reader(apikeyfile, delimiter=',')
@@ -81,52 +163,30 @@ with open('apikey.txt') as apikeyfile:
 auth_header = {'X-Auth-Token': x_auth_token}
 
 # process delete list file
+# pending_list keep every input line of the batch, including invalid ids, in input order
 with open('bulkderegister-result.csv', 'w') as inactive_result:
 	with open('inactive-devices.csv') as inactive_list:
-		devices = csv.reader(inactive_list, delimiter=',')
 		for devices in inactive_list:
-			device = devices.split(",")
-			device_id = device[0]
-			if count == batch_max:
+			device_id = devices.split(",")[0].strip()
+			if len(devices.strip()) == 0:
+				continue
+			pending_list.append(device_id)
+			if not device_id.isdigit():
+				print ('Invalid device id >' + device_id + '<. Skipped removal')
+				outcomes[device_id] = ('invalid_id', 0)
+				continue
+			devices_list.append(device_id)
+			if len(devices_list) == batch_max:
 				batch += 1
-				print ('Deleting batch', batch, 'of', count, 'endpoints')
-				d = remove_device(devices_list)
-				if d == 204:
-					print ('Batch removed successfuly')
-					inactive_result.write('success,'+ dev_list + '\n')
-				elif d == 401:
-					print ('Batch uninstall failed')
-					inactive_result.write('uninstall_failed,'+ dev_list + '\n')
-				elif d == 402:
-					print ('Batch delete failed')
-					inactive_result.write('delete_failed,'+ dev_list + '\n')
-				else:
-					print ('Batch removal failed with unknown return code: ', d)
-					inactive_result.write('unknown_error,'+ dev_list + '\n')
-				count = 1
+				print ('Deleting batch', batch, 'of', len(devices_list), 'endpoints')
+				process_batch(devices_list, 1)
+				write_batch(pending_list)
 				devices_list = []
-				devices_list.append(device_id)
-				dev_list = str(device_id)
+				pending_list = []
 				time.sleep(10)
-			else:
-				devices_list.append(device_id)
-				count += 1
-				if count == 1:
-					dev_list = str(device_id)
-				else:
-					dev_list = dev_list + '-' + str(device_id)
-			devices = csv.reader(inactive_list, delimiter=',')
-		print ('Deleting last batch batch of', count, 'endpoints')
-		d = remove_device(devices_list)
-		if d == 204:
-			print ('Batch removed successfuly')
-			inactive_result.write('success,'+ dev_list + '\n')
-		elif d == 401:
-			print ('Batch uninstall failed')
-			inactive_result.write('uninstall_failed,'+ dev_list + '\n')
-		elif d == 402:
-			print ('Batch delete failed')
-			inactive_result.write('delete_failed,' + dev_list + '\n')
-		else:
-			print ('Batch removal failed with unknown return code: ', d)
-			inactive_result.write('unknown_error,' + dev_list + '\n')
+		if len(pending_list) > 0:
+			batch += 1
+			if len(devices_list) > 0:
+				print ('Deleting last batch batch of', len(devices_list), 'endpoints')
+				process_batch(devices_list, 1)
+			write_batch(pending_list)
@@ -1,11 +1,12 @@
 # Name: deregister.py
 # Purpose: Script to remove inactive devices through Carbon Black Cloud Devices API
-# Version: 0.1.1
-# Last Update: 2020-01-06
+# Version: 0.1.2
+# Last Update: 2026-10-19
 #
 # Update History:
 # 0.1.0 - initial release
 # 0.1.1 - added logic to check last communication date change
+# 0.1.2 - compare last communication date as parsed timestamp
 #
 # Copyright (c) 2020 Steve Chan
 #
@@ -43,17 +44,17 @@ import csv
 import requests
 import json
 import time
+from devicerecord import DeviceRecord, parse_time
 
 def find_device(device_id, last_contact_date):
 	url_dev_information = "https://defense-prod05.conferdeploy.net/appservices/v6/orgs/" + org_key + "/devices/" + device_id
 	response = requests.get(url_dev_information,headers=auth_header)
-	r = response.json()
 	if response.ok:
-		device_status = r['status']
-		device_last_contact = r['last_contact_time']
-		if device_status == "DELETED":
+		r = DeviceRecord.from_json(response.json())
+		if r.status == "DELETED":
 			response.status_code = 999
-		elif (last_contact_date) != (device_last_contact):
+		elif r.last_contact == 0 or parse_time(last_contact_date) != r.last_contact:
+			# a missing or invalid last contact date is never a match
 			response.status_code = 888
 	return (response.status_code)
 
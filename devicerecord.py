@@ -0,0 +1,237 @@
+# Name: devicerecord.py
+# Purpose: Compact device record and streaming parser for Cb Defense device search results
+# Version: 0.1.0
+# Last Update 2026-10-19
+#
+# Update History
+# 0.1.0 - initial release
+#
+# Copyright (c) 2020 Steve Chan
+#
+# License:
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Reference: https://developer.carbonblack.com/reference/carbon-black-cloud/platform/latest/devices-api/
+# Reference section: Search Devices
+#
+# Notes:
+# Used by inactive.py, deregister.py and scheduler.py to hold device data
+# DeviceRecord keep only the fields used by the scripts instead of the full device json
+# status, policy name and sensor version strings are interned so they are shared between records
+# last_contact_time is parsed once to an integer timestamp in milliseconds since epoch (UTC)
+# for comparison, the raw last_contact_time string is kept as returned by the API for output
+# iter_devices parse the "results" array of a search response one device at a time
+# so a page is never held in memory as a list of complete device objects
+#
+# Usage example (benchmark of peak RSS and parse time against json parse of the full inventory and per page):
+# devicerecord.py - benchmark a synthetic 500000 devices inventory
+# devicerecord.py 100000 - benchmark a synthetic 100000 devices inventory
+
+import sys
+import json
+import codecs
+import calendar
+
+class DeviceRecord:
+	__slots__ = ('id', 'name', 'status', 'policy_name', 'sensor_version', 'last_contact', 'last_contact_time')
+
+	def __init__(self, device_id, name, status, policy_name, sensor_version, last_contact_time):
+		self.id = device_id
+		self.name = name
+		self.status = status
+		self.policy_name = policy_name
+		self.sensor_version = sensor_version
+		self.last_contact = parse_time(last_contact_time)
+		self.last_contact_time = last_contact_time
+
+	@classmethod
+	def from_json(cls, device):
+		return (cls(int(device.get('id') or 0),
+					device.get('name'),
+					intern_str(device.get('status')),
+					intern_str(device.get('policy_name')),
+					intern_str(device.get('sensor_version')),
+					device.get('last_contact_time')))
+
+def intern_str(value):
+	if value is None:
+		return (None)
+	return (sys.intern(str(value)))
+
+# Convert CB time format yyyy-mm-ddThh:mm:ss[.sss]Z to milliseconds since epoch
+# Return 0 when the time is missing or invalid
+def parse_time(time_text):
+	if not time_text:
+		return (0)
+	try:
+		seconds = calendar.timegm((int(time_text[0:4]), int(time_text[5:7]), int(time_text[8:10]),
+								   int(time_text[11:13] or 0), int(time_text[14:16] or 0), int(time_text[17:19] or 0)))
+	except ValueError:
+		return (0)
+	millis = 0
+	if time_text[19:20] == '.':
+		fraction = time_text[20:23].rstrip('Z')
+		if fraction.isdigit():
+			millis = int(fraction.ljust(3, '0'))
+	return (seconds * 1000 + millis)
+
+# Parse the devices of a search response from an iterator of bytes chunks
+# e.g. iter_devices(response.iter_content(chunk_size=65536)) with a stream=True request
+# Raise ValueError when the response has no complete results list (e.g. an error message)
+# The rest of the body after the results list is always read so a pooled connection can be reused
+# When a summary dict is passed it is updated with the other response fields (e.g. num_found)
+# once all the devices are parsed
+def iter_devices(chunks, summary=None):
+	decoder = json.JSONDecoder()
+	utf8 = codecs.getincrementaldecoder('utf-8')()
+	buffer = ''
+	head = ''
+	pos = 0
+	in_results = False
+	tail = None
+	for chunk in chunks:
+		if tail is not None:
+			tail += utf8.decode(chunk)
+			continue
+		buffer = buffer[pos:] + utf8.decode(chunk)
+		pos = 0
+		if not in_results:
+			key = buffer.find('"results"')
+			start = buffer.find('[', key) if key >= 0 else -1
+			if start < 0:
+				continue
+			in_results = True
+			head = buffer[:start + 1]
+			pos = start + 1
+		while True:
+			while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+				pos += 1
+			if pos >= len(buffer):
+				break
+			if buffer[pos] == ']':
+				tail = buffer[pos:]
+				break
+			try:
+				device, end = decoder.raw_decode(buffer, pos)
+			except json.JSONDecodeError:
+				# incomplete device object, wait for the next chunk
+				break
+			pos = end
+			yield DeviceRecord.from_json(device)
+	if tail is not None:
+		if summary is not None:
+			summary.update(json.loads(head + tail + utf8.decode(b'', True)))
+		return
+	if in_results:
+		raise ValueError('Device search response ended before the end of the results list')
+	raise ValueError('Device search response has no results list: ' + buffer[:200])
+
+# Benchmark section
+bench_count = 500000
+bench_chunk = 65536
+bench_page = 30000
+
+def bench_device(i):
+	return ({'id': 1000000 + i, 'name': 'HOST-' + str(i).zfill(7), 'email': 'user' + str(i) + '@example.com',
+			 'first_name': 'First' + str(i), 'last_name': 'Last' + str(i), 'middle_name': None,
+			 'organization_id': 1234, 'organization_name': 'example.com', 'policy_id': 1000 + i % 8,
+			 'policy_name': 'Policy-' + str(i % 8), 'target_priority': 'MEDIUM', 'status': 'REGISTERED',
+			 'registered_time': '2019-06-01T10:00:00.000Z', 'deregistered_time': None,
+			 'last_contact_time': '2020-0' + str(1 + i % 9) + '-1' + str(i % 10) + 'T12:34:56.' + str(i % 1000).zfill(3) + 'Z',
+			 'last_internal_ip_address': '10.' + str(i % 256) + '.' + str(i // 256 % 256) + '.1',
+			 'last_external_ip_address': '203.0.113.' + str(i % 256), 'last_location': 'OFFSITE',
+			 'os': 'WINDOWS', 'os_version': 'Windows 10 x64', 'sensor_version': '3.5.0.' + str(1000 + i % 4),
+			 'sensor_out_of_date': False, 'av_status': ['AV_ACTIVE', 'ONDEMAND_SCAN_DISABLED'],
+			 'av_engine': '4.13.0.207-ave.8.3.60.40:avpack.8.5.0.60:vdf.8.17.27.84', 'virtual_machine': bool(i % 2),
+			 'virtualization_provider': 'VMW_ESX', 'mac_address': '00:50:56:' + str(i % 100).zfill(2) + ':00:01',
+			 'quarantined': False, 'passive_mode': False, 'vdi_base_device': None, 'login_user_name': 'EXAMPLE\\user' + str(i),
+			 'activation_code': 'ABCDEF', 'activation_code_expiry_time': '2019-06-08T10:00:00.000Z',
+			 'ad_group_id': 0, 'device_owner_id': 500000 + i, 'encoded_activation_code': None,
+			 'last_device_policy_changed_time': '2019-06-01T10:00:00.000Z', 'last_policy_updated_time': '2019-06-01T10:00:00.000Z',
+			 'last_reported_time': '2020-01-01T00:00:00.000Z', 'last_reset_time': None, 'last_shutdown_time': None,
+			 'linux_kernel_version': None, 'sensor_kit_type': 'WINDOWS', 'sensor_pending_update': False,
+			 'windows_platform': None, 'scan_status': None, 'uninstall_code': 'UNINSTALL'})
+
+def bench_chunks(count, first=0):
+	yield b'{"num_found": ' + str(count).encode('utf-8') + b', "results": ['
+	part = []
+	size = 0
+	for i in range(first, first + count):
+		text = json.dumps(bench_device(i))
+		if i > first:
+			text = ',' + text
+		part.append(text)
+		size += len(text)
+		if size >= bench_chunk:
+			data = ''.join(part).encode('utf-8')
+			for start in range(0, len(data), bench_chunk):
+				yield data[start:start + bench_chunk]
+			part = []
+			size = 0
+	yield (''.join(part) + ']}').encode('utf-8')
+
+# Every mode keep the whole inventory in memory, only the parse is timed
+# json: one response.json() of the whole inventory, keeping the full device dicts
+# page: response.json() of one page of bench_page rows at a time, keeping (id, name, last_contact_time, sensor_version) tuples
+# record: iter_devices of one page of bench_page rows at a time, keeping DeviceRecord
+def bench_run(mode, count):
+	import time
+	import resource
+	parse_time_total = 0.0
+	if mode == 'json':
+		content = b''.join(bench_chunks(count))
+		parse_start = time.perf_counter()
+		devices = json.loads(content)['results']
+		parse_time_total = time.perf_counter() - parse_start
+		del content
+	else:
+		devices = []
+		for first in range(0, count, bench_page):
+			chunks = list(bench_chunks(min(bench_page, count - first), first))
+			parse_start = time.perf_counter()
+			if mode == 'page':
+				for device in json.loads(b''.join(chunks))['results']:
+					devices.append((device.get('id'), device.get('name'), device.get('last_contact_time'), device.get('sensor_version')))
+			else:
+				devices.extend(iter_devices(chunks))
+			parse_time_total += time.perf_counter() - parse_start
+			del chunks
+	peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	print (json.dumps({'mode': mode, 'devices': len(devices), 'parse_seconds': round(parse_time_total, 2), 'peak_rss_mb': round(peak_rss / 1024, 1)}))
+
+def bench_main(count):
+	import subprocess
+	print ('Benchmark of a synthetic', count, 'devices inventory, page size', bench_page)
+	print ('mode json: full inventory json parse, mode page: json parse per page into tuples, mode record: streaming DeviceRecord parse per page')
+	results = {}
+	for mode in ('json', 'page', 'record'):
+		result = subprocess.run([sys.executable, __file__, str(count), mode], capture_output=True, text=True)
+		if result.returncode != 0:
+			print (mode, 'failed:', result.stderr.strip().splitlines()[-1:])
+			continue
+		print (result.stdout.strip())
+		results[mode] = json.loads(result.stdout)
+	if 'page' in results and 'record' in results and results['page']['parse_seconds'] > 0:
+		print ('record parse time is', round(results['record']['parse_seconds'] / results['page']['parse_seconds'], 2), 'x the page parse time')
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1:
+		try: bench_count = int(sys.argv[1])
+		except ValueError:
+			print ('Device count is not a number. Override >' + sys.argv[1] + '< found')
+			sys.exit()
+	if len(sys.argv) > 2:
+		bench_run(sys.argv[2], bench_count)
+	else:
+		bench_main(bench_count)
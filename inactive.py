@@ -1,11 +1,12 @@
 # Name: inactive.py
 # Purpose: script to dump inactive registered Cb Defense endpoint
-# Version: 0.1.1
-# Last Update 2020-01-05
+# Version: 0.1.2
+# Last Update 2026-10-19
 #
 # Update History
 # 0.1.0 - initial release
 # 0.1.1 - added override inactive dates feature
+# 0.1.2 - parse search results into compact device records while downloading
 #
 # Copyright (c) 2020 Steve Chan
 #
@@ -37,6 +38,7 @@
 # CB API query maximum row is capped per API call
 # the limit is set in variable inc_cnt with a value of 30000
 # if the query returned with an 400 error then reduce the limit
+# each page is parsed while downloading and only the needed fields are kept (see devicerecord.py)
 #
 # Usage example:
 # inactive.py - dump all registered endpoints with last communication date less than 90 days from today
@@ -48,12 +50,14 @@ import csv
 import requests
 import json
 from datetime import datetime, timedelta
+from devicerecord import iter_devices, parse_time
 
 inactive_threshold = 90
 count = 0
 inc_cnt = 30000
 start_count = 0
 rows_count = 0
+no_contact = 0
 
 if len(sys.argv) == 1:
 	print ('No inactive threshold override. Default to 90 days')
@@ -74,6 +78,7 @@ else:
 
 inactive_datetime = str(datetime.now() - timedelta(days=inactive_threshold))
 inactive_date = inactive_datetime[:10]
+inactive_time = parse_time(inactive_date + 'T00:00:00Z')
 print ('Today date: ' + str(datetime.now())[:10] + ', inactive date: ' + inactive_date)
 inactive_date = inactive_date.replace('-','')[:8]
 
@@ -106,40 +111,58 @@ loop_last = int((json_data['num_found'])%(inc_cnt * loop_cnt))
 
 print ('Searching for inactive device with last communication date earlier than', inactive_date)
 
+# remove the incomplete output file so it cannot be used as a deregistration list
+def abort_search(f, data, message='Invalid query'):
+	print (message)
+	print (data)
+	f.close()
+	os.remove('inactivedevices.csv')
+	sys.exit()
+
 with open('inactivedevices.csv', 'w', newline = '') as f:
 	f.write('Device_Id,Device_Name,Inactive_date,Last_communication_date,Sensor_Version' + '\n')
 	if loop_cnt > 0:
 		for read_loop in range (0,loop_cnt):
 			data = {"criteria": {"status": ["REGISTERED"]},"start":start_count,"rows":inc_cnt}
 			print ('Searching', inc_cnt, 'devices from position', start_count)
-			response = requests.post(url_export,headers=auth_header, json=data)
-			json_data = response.json()
-			for device in json_data['results']:
-				last_contact_time = device.get('last_contact_time')
-				last_contact = last_contact_time.replace('-', '')[:8]
-				if (int(last_contact) < int(inactive_date)):
-					h_id = device.get('id')
-					h_name = device.get('name')
-					h_last_comm = device.get('last_contact_time')
-					h_sensor_ver = device.get('sensor_version')
-					name = str(h_id) + ',' + str(h_name) + ',' + str(inactive_date) + ',' + str(h_last_comm) + ',' + str(h_sensor_ver) + '\n'
-					count += 1
-					f.write(name)
+			try:
+				with requests.post(url_export,headers=auth_header, json=data, stream=True) as response:
+					if response.status_code != 200:
+						abort_search(f, data)
+					for device in iter_devices(response.iter_content(chunk_size=65536)):
+						if device.last_contact == 0:
+							no_contact += 1
+						elif device.last_contact < inactive_time:
+							h_id = device.id
+							h_name = device.name
+							h_last_comm = device.last_contact_time
+							h_sensor_ver = device.sensor_version
+							name = str(h_id) + ',' + str(h_name) + ',' + str(inactive_date) + ',' + str(h_last_comm) + ',' + str(h_sensor_ver) + '\n'
+							count += 1
+							f.write(name)
+			except (ValueError, requests.RequestException) as e:
+				abort_search(f, data, 'Search failed: ' + str(e))
 			start_count = start_count + inc_cnt + 1
 			print('Found', count, 'inactive devices')
 	print ('Searching', loop_last, 'devices from position', start_count)
 	data = 	 {"criteria": {"status": ["REGISTERED"]},"start":start_count,"rows":loop_last}
-	response = requests.post(url_export,headers=auth_header, json=data)
-	json_data = response.json()
-	for device in json_data['results']:
-		last_contact_time = device.get('last_contact_time')
-		last_contact = last_contact_time.replace('-', '')[:8]
-		if int(last_contact) < int(inactive_date):
-			h_id = device.get('id')
-			h_name = device.get('name')
-			h_last_comm = device.get('last_contact_time')
-			h_sensor_ver = device.get('sensor_version')
-			name = str(h_id) + ',' + str(h_name) + ',' + str(inactive_date) + ',' + str(h_last_comm) + ',' + str(h_sensor_ver) + '\n'
-			count += 1
-			f.write(name)
+	try:
+		with requests.post(url_export,headers=auth_header, json=data, stream=True) as response:
+			if response.status_code != 200:
+				abort_search(f, data)
+			for device in iter_devices(response.iter_content(chunk_size=65536)):
+				if device.last_contact == 0:
+					no_contact += 1
+				elif device.last_contact < inactive_time:
+					h_id = device.id
+					h_name = device.name
+					h_last_comm = device.last_contact_time
+					h_sensor_ver = device.sensor_version
+					name = str(h_id) + ',' + str(h_name) + ',' + str(inactive_date) + ',' + str(h_last_comm) + ',' + str(h_sensor_ver) + '\n'
+					count += 1
+					f.write(name)
+	except (ValueError, requests.RequestException) as e:
+		abort_search(f, data, 'Search failed: ' + str(e))
 	print ('Found', count, 'inactive devices')
+	if no_contact > 0:
+		print ('Skipped', no_contact, 'devices with no valid last communication date')
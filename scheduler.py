@@ -0,0 +1,383 @@
+# Name: scheduler.py
+# Purpose: Long running daemon to schedule the Cb Defense API utility jobs
+# Version: 0.1.1
+# Last Update 2026-10-19
+#
+# Update History
+# 0.1.0 - initial release
+# 0.1.1 - keep the inventory as compact device records
+#
+# Copyright (c) 2020 Steve Chan
+#
+# License:
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Input files:
+#	apikey.txt - Contain CB Defense API credentials, one org per line
+#		Content format: <api_secret_key>/<api_id>,<org_key>,<org_id>
+#		e.g. ABCDEF1234/ABC123,DEF123,1234
+# 	inactive-devices.csv - (optional) reviewed list of inactive endpoints to remove, same as deregister.py
+#		content format: <device>,<hostname>,<inactive_date_cutoff_date>,<last_contact_date>,<sensor_version>
+#
+# Output files: (prefixed with <org_key>- when apikey.txt contains more than one org)
+#	alert_list.csv - alerts.py output, appended on every run
+#	all-devices.csv - devicelist.py output
+#	inactivedevices.csv - inactive.py output
+#	inactive-devices-result.csv - deregister.py output
+#
+# Reference: https://developer.carbonblack.com/reference/carbon-black-cloud/platform/latest/alerts-api/
+# Reference: https://developer.carbonblack.com/reference/carbon-black-cloud/platform/latest/devices-api/
+#
+# Notes:
+# Replace the cron invocations of alerts.py, devicelist.py, inactive.py and deregister.py
+# Each org keep one requests session (connection pool) for the life of the daemon
+# Job interval: alerts hourly, devicelist daily, inactive and deregister weekly
+# The deregister job run right after the inactive job (see job_chain)
+# Every run is delayed by a random jitter of up to job_jitter seconds and jobs never run
+# at the same time so the scheduled runs don't pile up on the CB API throttling
+# The registered devices inventory is cached in memory for inventory_max_age seconds so the
+# inactive job and the deregister job following it share one download. The deregister job
+# drop the cache once done as its removals make it outdated
+# The deregister job skip the devices which last contact date changed in the inventory without
+# querying them, and check every other device through the device API right before its removal
+# The alerts job only query alerts created since the previous successful run
+# The deregister job only run when inactive-devices.csv exist. The file is renamed to
+# inactive-devices-<yyyymmdd>.csv once processed so the same list is not removed twice
+# Job timings and last success status are available in json format from
+# http://127.0.0.1:<port>/health
+#
+# Usage example:
+# scheduler.py - run the daemon with health endpoint on port 8080
+# scheduler.py 9090 - run the daemon with health endpoint on port 9090
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from devicerecord import DeviceRecord, iter_devices, parse_time
+
+base_url = "https://defense-prod05.conferdeploy.net/appservices/v6/orgs/"
+health_port = 8080
+inactive_threshold = 90
+inc_cnt = 30000
+job_jitter = 300
+job_gap = 30
+inventory_max_age = 3600
+
+# job name, interval in seconds
+job_list = [
+	('alerts', 3600),
+	('devicelist', 86400),
+	('inactive', 604800),
+	('deregister', 604800),
+]
+
+# job run right after another job instead of on its own schedule
+job_chain = {'inactive': 'deregister'}
+
+orgs = []
+job_status = {}
+status_lock = threading.Lock()
+started = datetime.now()
+
+if len(sys.argv) > 1:
+	try: health_port = int(sys.argv[1])
+	except ValueError:
+		print ('Health port is not a number. Override >' + sys.argv[1] + '< found')
+		sys.exit()
+
+def output_name(org, file_name):
+	if len(orgs) > 1:
+		return (org['org_key'] + '-' + file_name)
+	return (file_name)
+
+def log(org, message):
+	print (str(datetime.now())[:19], org['org_key'], message)
+
+# Fetch all registered devices as compact device records keyed by device id
+def fetch_inventory(org):
+	url_search = base_url + org['org_key'] + "/devices/_search"
+	inventory = {}
+	start_count = 0
+	num_found = 1
+	while start_count < num_found:
+		data = {"criteria": {"status": ["REGISTERED"]},"start":start_count,"rows":inc_cnt}
+		with org['session'].post(url_search, json=data, stream=True) as response:
+			if response.status_code != 200:
+				log(org, 'Inventory query failed with return code ' + str(response.status_code))
+				return (None)
+			page_count = 0
+			summary = {}
+			for device in iter_devices(response.iter_content(chunk_size=65536), summary):
+				inventory[device.id] = device
+				page_count += 1
+		num_found = int(summary['num_found'])
+		if page_count == 0 and start_count < num_found:
+			log(org, 'Inventory query returned no device at position ' + str(start_count) + ' of ' + str(num_found))
+			return (None)
+		start_count += page_count
+	log(org, 'Inventory fetched with ' + str(len(inventory)) + ' registered devices')
+	return (inventory)
+
+def get_inventory(org):
+	if org['inventory'] is None or time.time() - org['inventory_time'] > inventory_max_age:
+		org['inventory'] = fetch_inventory(org)
+		org['inventory_time'] = time.time()
+	else:
+		log(org, 'Reusing cached inventory of ' + str(len(org['inventory'])) + ' devices')
+	return (org['inventory'])
+
+def job_alerts(org):
+	event_end_time = datetime.utcnow()
+	if org['alert_mark'] is None:
+		event_start_time = event_end_time - timedelta(seconds=dict(job_list)['alerts'])
+	else:
+		event_start_time = org['alert_mark']
+	event_start = event_start_time.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+	event_end = event_end_time.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+	log(org, 'Searching alerts from ' + event_start + ' to ' + event_end)
+	url = base_url + org['org_key'] + "/alerts/cbanalytics/_search"
+	data = {'criteria': {'policy_applied': ['APPLIED'],'create_time': {'start': event_start, 'end': event_end}},'rows': 0}
+	response = org['session'].post(url, json=data)
+	if response.status_code != 200:
+		log(org, 'Invalid alerts query. Return code ' + str(response.status_code))
+		return (False)
+	data['rows'] = response.json()['num_found']
+	count = 0
+	if data['rows'] > 0:
+		response = org['session'].post(url, json=data)
+		if response.status_code != 200:
+			log(org, 'Invalid alerts query. Return code ' + str(response.status_code))
+			return (False)
+		output_file = output_name(org, 'alert_list.csv')
+		new_file = not os.path.exists(output_file)
+		with open(output_file, 'a') as f:
+			if new_file:
+				f.write('device_name,device_username,policy_name,create_date,create_time_utc,severity,process_name,reason,threat_cause_threat_category,blocked_threat_category,sensor_action,run_state,TTPS,device_id,legacy_alert_id,id' + '\n')
+			for alerts in response.json()['results']:
+				a_ttps_list = '|'.join([ttp['ttps'][0] for ttp in alerts['threat_indicators']])
+				a_detail = [str(alerts['device_name']), str(alerts['device_username']), str(alerts['policy_name']),
+							str(alerts['create_time'][0:10]), str(alerts['create_time'][11:-1]), str(alerts['severity']),
+							str(alerts['process_name']), str(alerts['reason']), str(alerts['threat_cause_threat_category']),
+							str(alerts['blocked_threat_category']), str(alerts['sensor_action']), str(alerts['run_state']),
+							a_ttps_list, str(alerts['device_id']), str(alerts['legacy_alert_id']), str(alerts['id'])]
+				f.write(','.join(a_detail) + '\n')
+				count += 1
+	org['alert_mark'] = event_end_time
+	log(org, 'Written ' + str(count) + ' alerts events')
+	return (True)
+
+def job_devicelist(org):
+	url = base_url + org['org_key'] + "/devices/_search/download?status=all"
+	with org['session'].get(url, stream=True) as response:
+		if not response.ok:
+			log(org, 'Device list download failed with return code ' + str(response.status_code))
+			return (False)
+		device_count = 0
+		with open(output_name(org, 'all-devices.csv'), 'w', newline = '') as f:
+			writer = csv.writer(f)
+			for line in response.iter_lines():
+				writer.writerow(line.decode('utf-8').replace('"','').split(','))
+				device_count += 1
+	log(org, str(device_count) + ' devices written to file successfully')
+	return (True)
+
+def job_inactive(org):
+	inventory = get_inventory(org)
+	if inventory is None:
+		return (False)
+	inactive_date = str(datetime.now() - timedelta(days=inactive_threshold))[:10]
+	inactive_time = parse_time(inactive_date + 'T00:00:00Z')
+	inactive_date = inactive_date.replace('-','')
+	count = 0
+	no_contact = 0
+	with open(output_name(org, 'inactivedevices.csv'), 'w', newline = '') as f:
+		f.write('Device_Id,Device_Name,Inactive_date,Last_communication_date,Sensor_Version' + '\n')
+		for device in inventory.values():
+			if device.last_contact == 0:
+				no_contact += 1
+			elif device.last_contact < inactive_time:
+				f.write(str(device.id) + ',' + str(device.name) + ',' + inactive_date + ',' + str(device.last_contact_time) + ',' + str(device.sensor_version) + '\n')
+				count += 1
+	log(org, 'Found ' + str(count) + ' inactive devices')
+	if no_contact > 0:
+		log(org, 'Skipped ' + str(no_contact) + ' devices with no valid last communication date')
+	return (True)
+
+# Check the device through the device API right before its removal
+# Return None when the device can be removed, otherwise the reason to skip it
+def check_device(org, device_id, last_contact_date):
+	url_dev_information = base_url + org['org_key'] + "/devices/" + device_id
+	response = org['session'].get(url_dev_information)
+	if not response.ok:
+		return ('not_found')
+	r = DeviceRecord.from_json(response.json())
+	if r.status == "DELETED":
+		return ('already_deleted')
+	# a missing or invalid last contact date is never a match
+	if r.last_contact == 0 or parse_time(last_contact_date) != r.last_contact:
+		return ('last_contact_date_changed')
+	return (None)
+
+# Need to uninstall before delete
+def remove_device(org, device_id):
+	url_action = base_url + org['org_key'] + "/device_actions"
+	data = {'action_type': 'UNINSTALL_SENSOR', 'device_id': [device_id]}
+	response = org['session'].post(url_action, json=data)
+	if response.status_code != 204:
+		return ('failed-uninstall')
+	time.sleep(5)
+	data = {'action_type': 'DELETE_SENSOR', 'device_id': [device_id]}
+	response = org['session'].post(url_action, json=data)
+	if response.status_code != 204:
+		return ('failed-deregister')
+	return ('success')
+
+def job_deregister(org):
+	input_file = output_name(org, 'inactive-devices.csv')
+	if not os.path.exists(input_file):
+		log(org, 'No ' + input_file + ' found. Nothing to remove')
+		org['inventory'] = None
+		return (True)
+	inventory = get_inventory(org)
+	org['inventory'] = None
+	if inventory is None:
+		return (False)
+	with open(output_name(org, 'inactive-devices-result.csv'), 'w') as inactive_result:
+		inactive_result.write('Device_Id,Device_Name,Inactive_date,Last_communication_date,Sensor_Version,Result' + '\n')
+		with open(input_file) as inactive_list:
+			for devices in inactive_list:
+				device = devices.rstrip('\n').split(',')
+				device_id = device[0]
+				record = inventory.get(int(device_id)) if device_id.isdigit() else None
+				if record is not None and (record.last_contact == 0 or record.last_contact != parse_time(device[3])):
+					result = 'last_contact_date_changed'
+				else:
+					# the inventory can be hours old by now, so always recheck before removal
+					result = check_device(org, device_id, device[3])
+					if result is None:
+						result = remove_device(org, device_id)
+				log(org, 'Device ' + device_id + ' - hostname ' + device[1] + ' ' + result)
+				inactive_result.write(','.join(device[:5]) + ',' + result + '\n')
+	os.rename(input_file, input_file[:-4] + '-' + datetime.now().strftime('%Y%m%d') + '.csv')
+	return (True)
+
+jobs = {
+	'alerts': job_alerts,
+	'devicelist': job_devicelist,
+	'inactive': job_inactive,
+	'deregister': job_deregister,
+}
+
+def run_job(org, job_name):
+	key = org['org_key'] + '/' + job_name
+	job_start = time.time()
+	with status_lock:
+		job_status[key]['last_start'] = str(datetime.now())[:19]
+	try:
+		ok = jobs[job_name](org)
+		error = None if ok else 'job failed, see log'
+	except Exception as e:
+		ok = False
+		error = str(e)
+	duration = round(time.time() - job_start, 3)
+	with status_lock:
+		status = job_status[key]
+		status['runs'] += 1
+		status['last_duration'] = duration
+		status['last_result'] = 'success' if ok else 'failed'
+		status['last_error'] = error
+		if ok:
+			status['last_success'] = status['last_start']
+		else:
+			status['failures'] += 1
+	log(org, job_name + ' ' + status['last_result'] + ' in ' + str(duration) + ' seconds')
+
+class HealthHandler(BaseHTTPRequestHandler):
+	def do_GET(self):
+		if self.path != '/health':
+			self.send_error(404)
+			return
+		with status_lock:
+			body = json.dumps({'started': str(started)[:19], 'jobs': job_status}, indent=2).encode('utf-8')
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass
+
+# read API and Org info, one org per line
+with open('apikey.txt') as apikeyfile:
+	for row in csv.reader(apikeyfile, delimiter=','):
+		if len(row) < 3:
+			continue
+		session = requests.Session()
+		session.headers.update({'X-Auth-Token': row[0].strip()})
+		session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+		orgs.append({'org_key': row[1].strip(), 'org_id': row[2].strip(), 'session': session,
+					 'inventory': None, 'inventory_time': 0, 'alert_mark': None})
+if len(orgs) == 0:
+	print ('No API key found in apikey.txt')
+	sys.exit()
+
+# stagger the first run of every job
+schedule = []
+for org in orgs:
+	first_run = {}
+	for job_name, interval in job_list:
+		next_run = time.time() + random.uniform(0, job_jitter)
+		for parent, chained in job_chain.items():
+			if chained == job_name:
+				next_run = first_run[parent]
+		first_run[job_name] = next_run
+		if job_name not in job_chain.values():
+			schedule.append([next_run, org, job_name, interval])
+		job_status[org['org_key'] + '/' + job_name] = {'interval': interval, 'next_run': str(datetime.fromtimestamp(next_run))[:19],
+													   'last_start': None, 'last_duration': None, 'last_result': None,
+													   'last_success': None, 'last_error': None, 'runs': 0, 'failures': 0}
+
+health_server = HTTPServer(('127.0.0.1', health_port), HealthHandler)
+threading.Thread(target=health_server.serve_forever, daemon=True).start()
+print ('Scheduler started for', len(orgs), 'org(s). Health endpoint http://127.0.0.1:' + str(health_port) + '/health')
+
+try:
+	while True:
+		schedule.sort(key=lambda entry: entry[0])
+		entry = schedule[0]
+		wait = entry[0] - time.time()
+		if wait > 0:
+			time.sleep(wait)
+		next_run, org, job_name, interval = entry
+		run_job(org, job_name)
+		if job_name in job_chain:
+			run_job(org, job_chain[job_name])
+		entry[0] = time.time() + interval + random.uniform(0, job_jitter)
+		with status_lock:
+			job_status[org['org_key'] + '/' + job_name]['next_run'] = str(datetime.fromtimestamp(entry[0]))[:19]
+			if job_name in job_chain:
+				job_status[org['org_key'] + '/' + job_chain[job_name]]['next_run'] = str(datetime.fromtimestamp(entry[0]))[:19]
+		time.sleep(job_gap)
+except KeyboardInterrupt:
+	print ('Scheduler stopped')
+	health_server.shutdown()